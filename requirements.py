@@ -2,5 +2,7 @@ dash>=2.14
 plotly>=5.18
 pandas>=2.0
 numpy>=1.24
+orjson
+pybase64
 gunicorn
 requests
@@ -7,10 +7,19 @@ Generate a ZZD Convergence Dashboard using Dash
  ***************************************************************************/
 """
 
-import base64
+import array
+import contextlib
+import gzip
+import hashlib
 import io
+import os
 import re
 import mmap
+import tempfile
+import threading
+import types
+import zlib
+from collections import OrderedDict
 import plotly.graph_objs as go
 import plotly.express as px
 from plotly.subplots import make_subplots
@@ -22,10 +31,17 @@ from dash import dcc, html
 import pandas as pd
 import numpy as np
 
+# SIMD base64 decoder when available; same output as the stdlib one
+try:
+    from pybase64 import b64decode as a2b_base64
+except ImportError:
+    from binascii import a2b_base64
+
 # Warning code descriptions
 # https://help.floodmodeller.com/docs/warning-messages-river
 # https://help.floodmodeller.com/docs/error-messages-river
-WARNING_DESCRIPTIONS = {
+# Read-only view: the table is shared by every callback thread and never edited
+WARNING_DESCRIPTIONS = types.MappingProxyType({
     "W2000": "Poor model convergence",
     "W2001": "Conduits with variable x-section are not permitted",
     "W2002": "Conduits with variable bottom friction are not permitted",
@@ -499,7 +515,14 @@ WARNING_DESCRIPTIONS = {
     "E1900": "Cannot allocate memory, status = n",
     "E1926": "One of many E1926 errors",
     "E1999": "One of many E1999 errors"
-}
+})
+
+# Fixed categorical dtype over every known code: parsed codes are stored as
+# small integers into this shared tuple rather than as one string per row,
+# and NOTE_LOOKUP is aligned with it so notes can be gathered by those integers.
+CODE_CATEGORIES = pd.CategoricalDtype(categories=tuple(WARNING_DESCRIPTIONS.keys()), ordered=False)
+NOTE_LOOKUP = np.array(list(WARNING_DESCRIPTIONS.values()), dtype=object)
+UNKNOWN_NOTE = "Unknown Warning"
 
 # --- Pre-compiled Regex Patterns ---
 RE_START = re.compile(rb'start time.*?(\d+\.?\d*)', re.IGNORECASE)
@@ -512,6 +535,36 @@ RE_WARN = re.compile(
     rb'Model time\s+(\d+\.?\d*).*?\n.*?\*\*\*\s+(warning|note|error)\s+(\w+)\s+\*\*\*\s+at label:\s+(\S+)',
     re.DOTALL | re.IGNORECASE
 )
+# Closing part of a RE_WARN record, used to find where the last one ends
+RE_LABEL_END = re.compile(rb'\*\*\*\s+at label:\s+\S+', re.IGNORECASE)
+
+# Literal prefixes of RE_CONV/RE_WARN. IGNORECASE disables re's own prefix
+# search, so candidates are located with a bare (still case-insensitive)
+# prefix scan and the full pattern is only tried at those offsets.
+CONV_ANCHOR = re.compile(re.escape(b'Poor model convergence'), re.IGNORECASE)
+WARN_ANCHOR = re.compile(re.escape(b'Model time'), re.IGNORECASE)
+
+def iter_anchored(pattern, buf, anchor, endpos=None, stop_on_miss=False):
+    """
+    Yields non-overlapping matches of pattern starting at matches of anchor,
+    equivalent to pattern.finditer(buf, 0, endpos) when every match begins with it.
+    Input: stop_on_miss (bool) - end the scan at the first failed match. Only valid
+           when the prefix is followed by a DOTALL '.*?': that gap can absorb any
+           later anchor, so a miss here means every later anchor misses too.
+    """
+    if endpos is None:
+        endpos = len(buf)
+    a = anchor.search(buf, 0, endpos)
+    while a:
+        m = pattern.match(buf, a.start(), endpos)
+        if m:
+            yield m
+            pos = m.end()
+        elif stop_on_miss:
+            return
+        else:
+            pos = a.end()
+        a = anchor.search(buf, pos, endpos)
 
 app = dash.Dash(__name__)
 server = app.server
@@ -616,10 +669,19 @@ app.layout = html.Div([
 })
 
 # --- Data Extraction ---
+def decode_column(values):
+    """
+    Decodes a list of byte strings with a single decode of their newline-joined
+    form. Fields are regex captures that never contain a newline.
+    """
+    if not values:
+        return []
+    return b'\n'.join(values).decode('utf-8', errors='ignore').split('\n')
+
 def extract_zzd_data(zzd_bytes):
     """
     Parses ZZD raw bytes efficiently using regex iterators.
-    Input: zzd_bytes (bytes) - Raw result from base64 decode
+    Input: zzd_bytes (bytes-like) - Raw result from base64 decode
     """
 
     # --- A. Fast Metadata Extraction ---
@@ -632,48 +694,55 @@ def extract_zzd_data(zzd_bytes):
     end_time = float(end_match.group(1)) if end_match else 0.0
 
     # --- B. Fast Data Extraction ---
-    dq_data = []
-    dh_data = []
-    warn_data = []
+    # Accumulate per-column arrays rather than a dict per row; numeric columns
+    # go into unboxed float64 arrays that numpy can later wrap without a copy
+    conv_t, dq_v, dh_v = array.array('d'), array.array('d'), array.array('d')
+    dq_n, dh_n = [], []
+    warn_t = array.array('d')
+    warn_type, warn_code, warn_label = [], [], []
 
     last_err_t = None
     last_err_c = None
 
     # 1. Extract Convergence Data (DQ & DH)
-    for m in RE_CONV.finditer(zzd_bytes):
-        t = float(m.group(1))
+    for m in iter_anchored(RE_CONV, zzd_bytes, CONV_ANCHOR, stop_on_miss=True):
+        conv_t.append(float(m.group(1)))
 
         # DQ Entry
-        dq_data.append({
-            'time': t,
-            'value': float(m.group(2)),
-            'node': m.group(3).decode('utf-8', errors='ignore')
-        })
+        dq_v.append(float(m.group(2)))
+        dq_n.append(m.group(3))
 
         # DH Entry
-        dh_data.append({
-            'time': t,
-            'value': float(m.group(4)),
-            'node': m.group(5).decode('utf-8', errors='ignore')
-        })
+        dh_v.append(float(m.group(4)))
+        dh_n.append(m.group(5))
 
     # 2. Extract Warnings
-    for m in RE_WARN.finditer(zzd_bytes):
+    # Every warning record ends with '*** at label: <label>', so stop the scan
+    # where the last one ends. Beyond it the DOTALL pattern can only fail, and it
+    # fails slowly: every remaining 'Model time' line re-walks the whole tail.
+    warn_end = 0
+    last_marker = zzd_bytes.rfind(b'***')
+    if last_marker != -1:
+        line_start = zzd_bytes.rfind(b'\n', 0, last_marker) + 1
+        tail = RE_LABEL_END.search(zzd_bytes, line_start)
+        warn_end = tail.end() if tail else len(zzd_bytes)
+
+    for m in iter_anchored(RE_WARN, zzd_bytes, WARN_ANCHOR, endpos=warn_end):
         t = float(m.group(1))
-        etype = m.group(2).decode('utf-8', errors='ignore').upper()
-        ecode = m.group(3).decode('utf-8', errors='ignore')
-        label = m.group(4).decode('utf-8', errors='ignore')
-
-        warn_data.append({
-            'time': t,
-            'type': etype,
-            'code': ecode,
-            'label': label
-        })
+        etype = m.group(2).upper()
 
-        if etype == 'ERROR':
+        warn_t.append(t)
+        warn_type.append(etype)
+        warn_code.append(m.group(3))
+        warn_label.append(m.group(4))
+
+        if etype == b'ERROR':
             last_err_t = t
-            last_err_c = ecode
+            last_err_c = m.group(3).decode('utf-8', errors='ignore')
+
+    # Text fields were kept as raw bytes; decode each column in one call
+    dq_n, dh_n = decode_column(dq_n), decode_column(dh_n)
+    warn_type, warn_code, warn_label = decode_column(warn_type), decode_column(warn_code), decode_column(warn_label)
 
     # --- C. Fatal Crash Check ---
     is_fatal = b"stopped in error" in zzd_bytes[-2000:]
@@ -682,19 +751,14 @@ def extract_zzd_data(zzd_bytes):
     # If regex failed to find explicit start/end times (common in crashed files),
     # we infer them from the data we actually found.
     if start_time == 0.0 or end_time == 0.0:
-        all_timestamps = []
+        # Records are in time order, so each source's first and last entries
+        # bound it (O(1) reads from the column buffers)
+        firsts = [col[0] for col in (conv_t, warn_t) if col]
+        lasts = [col[-1] for col in (conv_t, warn_t) if col]
 
-        # Collect timestamps from all sources
-        if dq_data:
-            all_timestamps.append(dq_data[0]['time'])
-            all_timestamps.append(dq_data[-1]['time'])
-        if warn_data:
-            all_timestamps.append(warn_data[0]['time'])
-            all_timestamps.append(warn_data[-1]['time'])
-
-        if all_timestamps:
-            if start_time == 0.0: start_time = min(all_timestamps)
-            if end_time == 0.0:   end_time = max(all_timestamps)
+        if firsts:
+            if start_time == 0.0: start_time = min(firsts)
+            if end_time == 0.0:   end_time = max(lasts)
 
     # Force a valid time duration if start == end
     # (e.g., if there is only 1 warning message at t=693.25 and nothing else)
@@ -705,9 +769,14 @@ def extract_zzd_data(zzd_bytes):
             end_time = start_time + 1.0  # Add 1 hr buffer so plot is visible
 
     # --- E. DataFrame Creation & Memory Optimization ---
-    df_dq = pd.DataFrame(dq_data)
-    df_dh = pd.DataFrame(dh_data)
-    df_w  = pd.DataFrame(warn_data)
+    # Columns are handed over as typed arrays so pandas skips dtype inference
+    conv_t = np.frombuffer(conv_t, dtype=np.float64)
+    df_dq = pd.DataFrame({'time': conv_t, 'value': np.frombuffer(dq_v, dtype=np.float64),
+                          'node': dq_n}, copy=False)
+    df_dh = pd.DataFrame({'time': conv_t, 'value': np.frombuffer(dh_v, dtype=np.float64),
+                          'node': dh_n}, copy=False)
+    df_w  = pd.DataFrame({'time': np.frombuffer(warn_t, dtype=np.float64), 'type': warn_type,
+                          'code': warn_code, 'label': warn_label}, copy=False)
 
     # Convert repetitive strings to Categoricals (Huge RAM saver)
     if not df_dq.empty:
@@ -717,13 +786,25 @@ def extract_zzd_data(zzd_bytes):
         df_dh['node'] = df_dh['node'].astype('category')
 
     if not df_w.empty:
-        # Map descriptions BEFORE converting to category
-        df_w['note'] = df_w['code'].map(WARNING_DESCRIPTIONS).fillna("Unknown Warning")
-
-        # Convert to category
-        df_w['code'] = df_w['code'].astype('category')
-        df_w['note'] = df_w['note'].astype('category')
+        # Map codes onto the shared categories; codes missing from the table
+        # are appended as extra categories so they are still reported
+        # (resolved up front: values outside a Categorical's dtype are deprecated)
+        categories = CODE_CATEGORIES.categories
+        notes = NOTE_LOOKUP
+        cat_codes = categories.get_indexer(warn_code)
+        unknown = cat_codes < 0
+        if unknown.any():
+            unknown_codes = np.asarray(warn_code, dtype=object)[unknown]
+            extra = pd.Index(sorted(set(unknown_codes)))
+            cat_codes[unknown] = len(categories) + extra.get_indexer(unknown_codes)
+            categories = categories.append(extra)
+            notes = np.concatenate((NOTE_LOOKUP, np.full(len(extra), UNKNOWN_NOTE, dtype=object)))
+        code_cat = pd.Categorical.from_codes(cat_codes, dtype=pd.CategoricalDtype(categories))
+
+        df_w['code'] = code_cat
+        df_w['note'] = pd.Categorical(notes[code_cat.codes])
         df_w['type'] = df_w['type'].astype('category')
+        df_w['label'] = df_w['label'].astype('category')
 
     return {
         'dq': df_dq,
@@ -735,7 +816,261 @@ def extract_zzd_data(zzd_bytes):
         'fail_c': last_err_c if is_fatal else None
     }
 
+# --- Upload Decoding ---
+# Multiple of 4 so every chunk is a whole number of base64 quads
+B64_CHUNK = 4 * 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+# Largest file a gzip upload may expand to (MB), so a small archive cannot
+# fill the worker's temp directory
+MAX_DECOMPRESSED_BYTES = int(os.environ.get('ZZD_MAX_DECOMPRESSED_MB', '4096')) * 1024 * 1024
+
+class UploadError(ValueError):
+    """Raised when an upload cannot be decoded; the message is shown to the user."""
+
+class UploadTooLarge(UploadError):
+    """Raised when a compressed upload expands beyond MAX_DECOMPRESSED_BYTES."""
+
+@contextlib.contextmanager
+def open_upload(contents):
+    """
+    Decodes a dcc.Upload data URL chunk-by-chunk into a temporary file and yields
+    a read-only mmap of it, so the decoded file lives in the page cache rather
+    than in a second full-size heap copy. Gzipped files are decompressed.
+    Input: contents (str) - 'data:<mime>;base64,<payload>'
+    """
+    start = contents.index(',') + 1
+    with tempfile.TemporaryFile() as f:
+        for i in range(start, len(contents), B64_CHUNK):
+            f.write(a2b_base64(contents[i:i + B64_CHUNK]))
+
+        # Accept gzip-compressed uploads (e.g. .zzd.gz) transparently
+        f.seek(0)
+        if f.read(2) == GZIP_MAGIC:
+            f.seek(0)
+            with gzip.GzipFile(fileobj=f) as gz, tempfile.TemporaryFile() as out:
+                size = 0
+                try:
+                    # Read one byte past the limit so an exact fit is not rejected
+                    while chunk := gz.read(min(B64_CHUNK, MAX_DECOMPRESSED_BYTES + 1 - size)):
+                        size += len(chunk)
+                        if size > MAX_DECOMPRESSED_BYTES:
+                            raise UploadTooLarge(
+                                f"Decompressed file exceeds {MAX_DECOMPRESSED_BYTES // (1024 * 1024)} MB")
+                        out.write(chunk)
+                except (gzip.BadGzipFile, EOFError, zlib.error) as e:
+                    raise UploadError(f"Corrupt or truncated gzip file ({e})") from e
+                with _map_file(out) as mm:
+                    yield mm
+        else:
+            with _map_file(f) as mm:
+                yield mm
+
+@contextlib.contextmanager
+def _map_file(f):
+    f.flush()
+    if os.fstat(f.fileno()).st_size == 0:
+        yield b''  # mmap cannot map an empty file
+        return
+
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # The parser walks the file front to back; let the kernel read ahead
+        if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        yield mm
+
+# --- Parse Cache ---
+# Tolerance edits re-run the callback with the same upload, so parsed results
+# are memoized by a digest of the upload (small LRU, shared by threads). The
+# base64 payload is hashed directly so a cache hit skips decoding entirely.
+PARSE_CACHE_SIZE = 8
+_parse_cache = OrderedDict()
+_parse_cache_lock = threading.Lock()
+
+def upload_digest(contents):
+    """
+    Returns a 16-byte digest of the base64 payload of a dcc.Upload data URL,
+    hashed in chunks to avoid encoding the whole string at once.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for i in range(contents.index(',') + 1, len(contents), B64_CHUNK):
+        h.update(contents[i:i + B64_CHUNK].encode('ascii'))
+    return h.digest()
+
+def load_zzd_data(contents, key=None):
+    """
+    Returns extract_zzd_data() of an uploaded file, re-using the cached result
+    for an upload that has already been parsed. The returned dict must be
+    treated as read-only.
+    Input: contents (str) - 'data:<mime>;base64,<payload>'
+           key (bytes) - upload_digest(contents), if the caller already has it
+    """
+    if key is None:
+        key = upload_digest(contents)
+    with _parse_cache_lock:
+        data = _parse_cache.get(key)
+        if data is not None:
+            _parse_cache.move_to_end(key)
+            return data
+
+    # Pass the RAW BYTES to the optimized function (Do NOT .decode('utf-8')).
+    # The parsed result holds no reference to the map.
+    with open_upload(contents) as zzd_buf:
+        data = extract_zzd_data(zzd_buf)
+
+    with _parse_cache_lock:
+        _parse_cache[key] = data
+        while len(_parse_cache) > PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+    return data
+
+# --- Downsampling ---
+MAX_POINTS_PER_TRACE = 2000
+# Caps the whole convergence figure too. The budget is shared between traces
+# but never below the floor (which keeps peaks visible), so only the
+# worst-ranked nodes that fit MAX_TRACES are drawn.
+MAX_POINTS_PER_FIGURE = 100_000
+MIN_POINTS_PER_TRACE = 100
+MAX_TRACES = MAX_POINTS_PER_FIGURE // MIN_POINTS_PER_TRACE
+
+def downsample_minmax(x, y, n_out=MAX_POINTS_PER_TRACE):
+    """
+    Reduces a series to roughly n_out points by keeping the min and max of each
+    index bucket, so peak violations survive the decimation.
+    Input: x, y (np.ndarray) - time-ordered arrays of equal length
+    """
+    n = len(y)
+    if n <= n_out:
+        return x, y
+
+    # Pad to a whole number of buckets so the reduction is a single 2D pass
+    k = -(-n // (n_out // 2))
+    n_bins = -(-n // k)
+    padded = np.full(n_bins * k, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_bins, k)
+
+    base = np.arange(n_bins) * k
+    idx = np.unique(np.concatenate((base + np.nanargmin(padded, axis=1),
+                                    base + np.nanargmax(padded, axis=1))))
+    return x[idx], y[idx]
+
+# --- Aggregation ---
+def violation_mask(df, tol):
+    """
+    Flags rows whose |value| reaches the tolerance, in one pass over the raw array.
+    Input: df (pd.DataFrame) - DQ/DH frame
+    """
+    return np.abs(df['value'].to_numpy()) >= tol
+
+def count_violations(df, mask):
+    """
+    Counts tolerance violations per node in a single pass over the category codes.
+    Input: df (pd.DataFrame) - DQ/DH frame with a categorical 'node' column
+           mask (np.ndarray) - violation_mask() of df
+    """
+    if df.empty:
+        return pd.Series(dtype=np.int64)
+
+    node_codes = df['node'].cat.codes.to_numpy()[mask]
+    counts = np.bincount(node_codes, minlength=len(df['node'].cat.categories))
+    return pd.Series(counts, index=df['node'].cat.categories)
+
+def code_notes(df_w):
+    """
+    Returns the parsed note of each observed code, as a Series indexed by code.
+    Input: df_w (pd.DataFrame) - warning frame with categorical 'code'/'note' columns
+    """
+    first = df_w.drop_duplicates('code')
+    return pd.Series(first['note'].to_numpy(), index=first['code'].to_numpy())
+
+HEATMAP_BINS = 100
+
+def bin_warnings(df_w, t_bins):
+    """
+    Counts warnings per (code, time bin) with one bincount over a flat index,
+    matching np.histogram2d on uniform time edges (out-of-range times dropped).
+    Input: df_w (pd.DataFrame) - warning frame with a categorical 'code' column
+           t_bins (np.ndarray) - uniformly spaced time bin edges
+    Returns: (codes in sorted order, int counts of shape [len(codes), len(t_bins) - 1])
+    """
+    cat_codes = df_w['code'].cat.codes.to_numpy()
+    categories = df_w['code'].cat.categories
+
+    # Rows are the observed codes in sorted order
+    used = np.flatnonzero(np.bincount(cat_codes, minlength=len(categories)))
+    used = used[np.argsort(categories[used].to_numpy())]
+    row_of = np.empty(len(categories), dtype=np.intp)
+    row_of[used] = np.arange(len(used))
+
+    t = df_w['time'].to_numpy()
+    inside = (t >= t_bins[0]) & (t <= t_bins[-1])
+    t = t[inside]
+    rows = row_of[cat_codes[inside]]
+
+    # Uniform-bin index, then nudged across edges the way np.histogram does
+    n_bins = len(t_bins) - 1
+    tb = ((t - t_bins[0]) * (n_bins / (t_bins[-1] - t_bins[0]))).astype(np.intp)
+    tb[tb == n_bins] = n_bins - 1
+    tb -= t < t_bins[tb]
+    tb += (t >= t_bins[tb + 1]) & (tb != n_bins - 1)
+
+    counts = np.bincount(rows * n_bins + tb, minlength=len(used) * n_bins)
+    return categories[used].tolist(), counts.reshape(len(used), n_bins)
+
+# --- Figure Skeletons ---
+# Subplot grids, titles and static axis labels are laid out once at import;
+# each callback starts from a copy instead of re-running make_subplots.
+def _build_conv_skeleton():
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.10,
+                        subplot_titles=('DQ Convergence (Violations Only)', 'DH Convergence (Violations Only)'))
+    fig.update_yaxes(title_text="DQ (m³/s)", row=1, col=1)
+    fig.update_yaxes(title_text="DH (m)", row=2, col=1)
+    fig.update_xaxes(title_text="Model Time (hr)", row=2, col=1)
+    fig.update_layout(margin=dict(l=60, r=40, t=40, b=40), showlegend=True)
+    return fig
+
+def _build_warn_skeleton():
+    fig = make_subplots(rows=2, cols=1, row_heights=[0.7, 0.3], vertical_spacing=0.10,
+                        subplot_titles=('Temporal Warning Distribution', 'Total Warning Counts'))
+    fig.update_xaxes(title_text="Model Time (hr)", row=1, col=1)
+    # Apply Log Scale to Warning Count
+    fig.update_xaxes(type="log", title_text="Message Count", row=2, col=1)
+    fig.update_layout(margin=dict(l=60, r=40, t=40, b=40), showlegend=False)
+    return fig
+
+# The convergence figure is returned as a plain dict (Dash accepts those), so
+# its layout is kept pre-rendered; callbacks shallow-copy it and never mutate it
+CONV_FIG_LAYOUT = _build_conv_skeleton().to_dict()['layout']
+WARN_FIG_SKELETON = _build_warn_skeleton()
+
+def _axis_ids(row):
+    """Returns the (xaxis, yaxis) ids of a row in a single-column subplot grid."""
+    return ('x', 'y') if row == 1 else (f'x{row}', f'y{row}')
+
+def _hline(y, text, row):
+    """Shape and annotation dicts equivalent to Figure.add_hline(annotation_position='top right')."""
+    xref, yref = _axis_ids(row)
+    shape = dict(type='line', xref=f'{xref} domain', yref=yref, x0=0, x1=1, y0=y, y1=y,
+                 line=dict(color='black', dash='dot', width=1))
+    note = dict(text=text, showarrow=False, xref=f'{xref} domain', yref=yref,
+                x=1, y=y, xanchor='right', yanchor='bottom')
+    return shape, note
+
+def _vline(x, text, row):
+    """Shape and annotation dicts equivalent to Figure.add_vline() for the fatal error marker."""
+    xref, yref = _axis_ids(row)
+    shape = dict(type='line', xref=xref, yref=f'{yref} domain', x0=x, x1=x, y0=0, y1=1,
+                 line=dict(color='red', dash='dash', width=3))
+    note = dict(text=text, showarrow=False, xref=xref, yref=f'{yref} domain',
+                x=x, y=1, xanchor='left', yanchor='top')
+    return shape, note
+
 # --- Plotting ---
+# Node marker cycles and outline, built once rather than on every trace
+SYMBOLS = ('circle', 'square', 'diamond', 'cross', 'x', 'triangle-up', 'star', 'hexagram')
+COLORS = tuple(px.colors.qualitative.Dark24 + px.colors.qualitative.Alphabet)
+MARKER_LINE = dict(width=1, color='DarkSlateGrey')
+
 @app.callback(
     [Output('convergence-graph', 'figure'),
      Output('warning-graph', 'figure'),
@@ -748,115 +1083,148 @@ def update_dashboard(contents, qtol, htol, filename):
     if not contents:
         return go.Figure(), go.Figure(), "No file selected", ""
 
-    # 1. Get RAW BYTES
-    _, content_str = contents.split(',')
-    decoded_bytes = base64.b64decode(content_str)
-
-    # 2. Pass BYTES to the optimized function (Do NOT .decode('utf-8'))
-    data = extract_zzd_data(decoded_bytes)
+    # Decode and parse the upload, or fetch it from the cache
+    digest = upload_digest(contents)
+    try:
+        data = load_zzd_data(contents, digest)
+    except UploadError as e:
+        return go.Figure(), go.Figure(), filename, f"⚠ {e}"
+    # uirevision keyed on the upload content keeps pan/zoom across tolerance
+    # changes, but resets it for new data even under the same filename
+    ui_revision = digest.hex()
+
+    # Calculate duration and a 2% buffer for the time axes
+    duration = data['end'] - data['start']
+    # Avoid buffer if duration is 0 to prevent errors
+    buffer = duration * 0.02 if duration > 0 else 1.0
+    time_range = [data['start'] - buffer, data['end'] + buffer]
 
     # 1. Convergence Plot
-    c_fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.10,
-                         subplot_titles=('DQ Convergence (Violations Only)', 'DH Convergence (Violations Only)'))
 
     # --- NEW: Pre-calculate total violations per node for sorting ---
     # We combine DQ and DH violations to find the "worst" nodes across both categories
-    dq_counts = data['dq'][data['dq']['value'].abs() >= qtol]['node'].value_counts()
-    dh_counts = data['dh'][data['dh']['value'].abs() >= htol]['node'].value_counts()
+    # Each mask is computed once and shared by the counts and the node traces
+    masks = {'dq': violation_mask(data['dq'], qtol), 'dh': violation_mask(data['dh'], htol)}
+    dq_counts = count_violations(data['dq'], masks['dq'])
+    dh_counts = count_violations(data['dh'], masks['dh'])
 
     # Combine counts (fill NaN with 0 for nodes that only violate one criteria)
     total_counts = dq_counts.add(dh_counts, fill_value=0).sort_values(ascending=False)
-    sorted_nodes = total_counts.index.tolist()
+    sorted_nodes = total_counts[total_counts > 0].index.tolist()
 
     # --- Corrected Legend Logic ---
-    seen_nodes = set() # Track nodes to ensure they appear in legend exactly once
-
-    for df_key, row, val in [('dq', 1, qtol), ('dh', 2, htol)]:
+    # Each node appears in the legend exactly once: on its DQ trace if it has
+    # one, otherwise on its DH trace
+    dq_nodes = set(dq_counts.index[dq_counts > 0])
+
+    # Keep the worst nodes whose DQ + DH traces fit in MAX_TRACES, then share
+    # the figure-wide point budget between the traces about to be drawn
+    node_traces = ((dq_counts.reindex(sorted_nodes, fill_value=0) > 0).to_numpy(dtype=np.intp)
+                   + (dh_counts.reindex(sorted_nodes, fill_value=0) > 0).to_numpy(dtype=np.intp))
+    n_nodes = len(sorted_nodes)
+    n_shown = int(np.searchsorted(np.cumsum(node_traces), MAX_TRACES, side='right'))
+    sorted_nodes = sorted_nodes[:n_shown]
+    n_traces = int(node_traces[:n_shown].sum())
+    trace_points = MAX_POINTS_PER_TRACE
+    if n_traces:
+        trace_points = max(MIN_POINTS_PER_TRACE,
+                           min(MAX_POINTS_PER_TRACE, MAX_POINTS_PER_FIGURE // n_traces))
+
+    # Traces are plain dicts: the figure is never validated server-side
+    traces, trace_rows = [], set()
+    for df_key, row in [('dq', 1), ('dh', 2)]:
         df = data[df_key]
         if not df.empty:
-            df_filtered = df[df['value'].abs() >= val]
+            df_filtered = df.iloc[masks[df_key]]
+            # One grouping pass gives each node's row positions, in time order
+            node_rows = df_filtered.groupby('node', observed=True, sort=False).indices
+            times = df_filtered['time'].to_numpy()
+            values = df_filtered['value'].to_numpy()
+
+            xref, yref = _axis_ids(row)
 
             for i, node in enumerate(sorted_nodes):
-                nd = df_filtered[df_filtered['node'] == node]
-                if nd.empty:
+                rows = node_rows.get(node)
+                if rows is None:
                     continue
 
-                # Determine if this is the first time we are plotting this node
-                # If it is, we show it in the legend.
-                show_in_legend = False
-                if node not in seen_nodes:
-                    show_in_legend = True
-                    seen_nodes.add(node)
+                show_in_legend = df_key == 'dq' or node not in dq_nodes
 
                 this_dq = int(dq_counts.get(node, 0))
                 this_dh = int(dh_counts.get(node, 0))
                 custom_label = f"{node} | DQ: {this_dq}, DH: {this_dh}"
 
-                symbols = ['circle', 'square', 'diamond', 'cross', 'x', 'triangle-up', 'star', 'hexagram']
-                colors = px.colors.qualitative.Dark24 + px.colors.qualitative.Alphabet
+                # Cap the points shipped to the browser for very noisy nodes
+                x, y = downsample_minmax(times[rows], values[rows], trace_points)
 
-                c_fig.add_trace(go.Scattergl(
-                    x=nd['time'],
-                    y=nd['value'],
+                traces.append(dict(
+                    type='scattergl',
+                    xaxis=xref,
+                    yaxis=yref,
+                    x=x,
+                    y=y,
                     mode='markers',
                     name=custom_label,
                     legendgroup=node,
                     showlegend=show_in_legend, # Corrected: Shows for the first occurrence found
                     marker=dict(
-                        symbol=symbols[i % len(symbols)],
-                        color=colors[i % len(colors)],
+                        symbol=SYMBOLS[i % len(SYMBOLS)],
+                        color=COLORS[i % len(COLORS)],
                         size=8,
-                        line=dict(width=1, color='DarkSlateGrey')
+                        line=MARKER_LINE
                     )
-                ), row=row, col=1)
+                ))
+                trace_rows.add(row)
 
-        # Static X-range based on parsed file bounds
-        c_fig.update_xaxes(range=[data['start'], data['end']], row=row, col=1)
+    # Both rows are Time, so they share the static X-range
+    c_layout = dict(CONV_FIG_LAYOUT,
+                    xaxis=dict(CONV_FIG_LAYOUT['xaxis'], range=time_range),
+                    xaxis2=dict(CONV_FIG_LAYOUT['xaxis2'], range=time_range),
+                    uirevision=ui_revision)
+    lines = []
 
-    # Row 1: DQ Tolerance
-    c_fig.add_hline(y=qtol, line_dash="dot", line_color="black", line_width=1,
-                    annotation_text=f"QTOL (+{qtol})", annotation_position="top right", row=1, col=1)
-
-    # Row 2: DH Tolerance
-    c_fig.add_hline(y=htol, line_dash="dot", line_color="black", line_width=1,
-                    annotation_text=f"HTOL (+{htol})", annotation_position="top right", row=2, col=1)
+    # Row 1: DQ Tolerance, Row 2: DH Tolerance (drawn on rows that have data)
+    for row, tol, name in ((1, qtol, 'QTOL'), (2, htol, 'HTOL')):
+        if row in trace_rows:
+            lines.append(_hline(tol, f"{name} (+{tol})", row))
 
     # 2. Warning Plot
-    w_fig = make_subplots(rows=2, cols=1, row_heights=[0.7, 0.3], vertical_spacing=0.10,
-                          subplot_titles=('Temporal Warning Distribution', 'Total Warning Counts'))
+    w_fig = go.Figure(WARN_FIG_SKELETON)
 
     if not data['warnings'].empty:
         df_w = data['warnings']
+        # The parsed 'note' column is the single source of each code's description
+        notes_by_code = code_notes(df_w)
 
-        # 1. Prepare unique codes and notes
-        unique_codes = sorted(df_w['code'].unique())
-        code_to_idx = {code: i for i, code in enumerate(unique_codes)}
-        heatmap_notes = [WARNING_DESCRIPTIONS.get(c, "N/A") for c in unique_codes]
+        # 1. Pre-calculate 2D Histogram counts manually
+        # 100 bins for time (X) and 1 row per code (Y), already in [y, x] layout
+        t_bins = np.linspace(data['start'], data['end'], HEATMAP_BINS + 1)
+        unique_codes, counts = bin_warnings(df_w, t_bins)
+        counts = counts.astype(np.int32, copy=False)
 
-        # 2. Pre-calculate 2D Histogram counts manually
-        # Create 100 bins for time (X) and 1 bin per code (Y)
-        t_bins = np.linspace(data['start'], data['end'], 101)
-        c_bins = np.arange(len(unique_codes) + 1)
+        # Drop codes that never fire inside the plotted window (all-empty rows)
+        nonempty = counts.any(axis=1)
+        if not nonempty.all():
+            counts = counts[nonempty]
+            unique_codes = [c for c, keep in zip(unique_codes, nonempty) if keep]
 
-        counts, x_edges, y_edges = np.histogram2d(
-            df_w['time'],
-            df_w['code'].map(code_to_idx),
-            bins=[t_bins, c_bins]
-        )
+        # 2. Prepare notes
+        heatmap_notes = notes_by_code[unique_codes].tolist()
 
         # 3. Log-transform the Z data (counts)
-        # We use log10(n + 1) to ensure 0 stays 0 and 1 is distinguishable
-        # Transpose counts to match Plotly Heatmap [row, col] -> [y, x]
-        z_log = np.log10(counts.T + 1)
+        # We use log10(n + 1) to ensure 0 stays 0 and 1 is distinguishable.
+        # float32 is plenty for a colour scale and halves the encoded array.
+        z_log = np.log10(counts + 1, dtype=np.float32)
         z_log[z_log == 0] = np.nan  # Transparent for zero values
 
         # 4. Create Note grid for customdata (mapping notes to the Y-axis)
-        # Shape must match z_log [len(unique_codes) x 100]
-        note_grid = np.array([[note] * 100 for note in heatmap_notes])
+        # Shape must match z_log [len(unique_codes) x 100]; broadcast, not copied
+        note_col = np.asarray(heatmap_notes, dtype=object).reshape(-1, 1)
+        note_grid = np.broadcast_to(note_col, counts.shape)
 
         # 1. Define Logarithmic Tick Marks for the Color Bar
         # This creates labels like 1, 10, 100, 1000 at the correct log positions
-        max_val = counts.max()
+        max_val = counts.max(initial=0)
         # Find the highest power of 10 needed
         max_log = int(np.ceil(np.log10(max_val))) if max_val > 0 else 1
         tick_vals = [np.log10(10**i + 1) for i in range(max_log + 1)]
@@ -869,7 +1237,7 @@ def update_dashboard(contents, qtol, htol, filename):
             z=z_log,
             colorscale='Viridis',
             hoverongaps=False,
-            customdata=np.stack((counts.T, note_grid), axis=-1),
+            customdata=np.stack((counts, note_grid), axis=-1),
             colorbar=dict(
                 title="Count",
                 tickvals=tick_vals,
@@ -886,8 +1254,10 @@ def update_dashboard(contents, qtol, htol, filename):
         ), row=1, col=1)
 
         # 3. Bar Chart (Bottom)
-        df_w['note'] = df_w['code'].map(lambda x: WARNING_DESCRIPTIONS.get(x, "N/A"))
-        counts = df_w.groupby(['code', 'type', 'note'], observed=True).size().reset_index(name='count')
+        # 'note' depends only on 'code', so it is attached per group afterwards
+        counts = df_w.groupby(['code', 'type'], observed=True).size().reset_index(name='count')
+        counts['note'] = notes_by_code[counts['code'].to_numpy()].to_numpy()
+        counts['count'] = pd.to_numeric(counts['count'], downcast='unsigned')
         counts = counts.sort_values('count', ascending=False)
 
         bar_colors = ['#e74c3c' if t == 'ERROR' else '#3498db' for t in counts['type']]
@@ -909,68 +1279,30 @@ def update_dashboard(contents, qtol, htol, filename):
         ), row=2, col=1)
 
     # --- Corrected Global Axis & Fatal Error Logic ---
-    # Calculate duration and a 2% buffer
-    duration = data['end'] - data['start']
-    # Avoid buffer if duration is 0 to prevent errors
-    buffer = duration * 0.02 if duration > 0 else 1.0
-
-    # 1. Convergence Plot: Both rows are Time, so we can update all x-axes
-    c_fig.update_xaxes(
-        range=[data['start'] - buffer, data['end'] + buffer],
-    )
-
-    # Update DQ axis labels
-    c_fig.update_yaxes(
-        title_text="DQ (m³/s)",
-        row=1, col=1
-    )
-
-    # Update DH axis labels
-    c_fig.update_yaxes(
-        title_text="DH (m)",
-        row=2, col=1
-    )
-
-    c_fig.update_xaxes(
-        title_text="Model Time (hr)",
-        row=2, col=1
-    )
-
     # Warning Plot Heatmap
-    w_fig.update_xaxes(
-        range=[data['start'] - buffer, data['end'] + buffer],
-        row=1, col=1,
-        title_text="Model Time (hr)",
-    )
-
-    w_fig.update_xaxes(
-        row=2, col=1,
-        title_text="Message Count",
-    )
-
-    # Apply Log Scale to Warning Count
-    w_fig.update_xaxes(
-        type="log",
-        row=2, col=1,
-        title_text="Message Count",
-    )
+    w_fig.update_xaxes(range=time_range, row=1, col=1)
 
     # 3. Fatal Error Line: Only add to subplots that use a Time x-axis
     if data['fail_t']:
-        # Add to both rows of Convergence plot
-        c_fig.add_vline(x=data['fail_t'], line_width=3, line_dash="dash", line_color="red",
-                       annotation_text=f"FAIL: {data['fail_c']}")
+        # Add to each populated row of the Convergence plot
+        for row in sorted(trace_rows):
+            lines.append(_vline(data['fail_t'], f"FAIL: {data['fail_c']}", row))
 
         # Add ONLY to the top row of the Warning plot
         w_fig.add_vline(x=data['fail_t'], line_width=3, line_dash="dash", line_color="red",
                        annotation_text=f"FAIL: {data['fail_c']}", row=1, col=1)
 
+    if lines:
+        c_layout['shapes'] = [shape for shape, _ in lines]
+        c_layout['annotations'] = CONV_FIG_LAYOUT['annotations'] + [note for _, note in lines]
+    c_fig = {'data': traces, 'layout': c_layout}
+
     fig_title = f"ZZD Analysis: {filename}"
-    c_fig.update_layout(margin=dict(l=60, r=40, t=40, b=40), showlegend=True)
-    w_fig.update_layout(margin=dict(l=60, r=40, t=40, b=40), showlegend=False)
+    w_fig.update_layout(uirevision=ui_revision)
 
     status = f"Sim: {data['start']} to {data['end']} hrs"
     if data['fail_t']: status += f" | ⚠ FAILED AT {data['fail_t']}h"
+    if n_shown < n_nodes: status += f" | Top {n_shown} of {n_nodes} nodes plotted"
 
     return c_fig, w_fig, filename, status
 